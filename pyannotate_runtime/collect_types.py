@@ -13,6 +13,7 @@ For the module consumer, the workflow looks like that:
 4) call dump_stats(file_name) to dump all collected info to the file as json
 
 You can repeat start() / stop() as many times as you want.
+Call reset_state() to discard everything collected so far.
 
 The module is based on Tony's 2016 prototype D219371.
 """
@@ -30,17 +31,15 @@ import opcode
 import os
 import sys
 import threading
-from inspect import ArgInfo
-from threading import Thread
 
 from mypy_extensions import TypedDict
 from six import iteritems
 from six.moves import range
-from six.moves.queue import Queue  # type: ignore  # No library stub yet
 from typing import (
     Any,
     Callable,
     Dict,
+    FrozenSet,
     Iterable,
     Iterator,
     List,
@@ -54,6 +53,15 @@ from typing import (
 )
 from contextlib import contextmanager
 
+# orjson is an optional dependency; fall back to the json module. Set the
+# PYANNOTATE_FAST_JSON environment variable to 0 to always use the json module.
+orjson = None  # type: Any
+if os.environ.get('PYANNOTATE_FAST_JSON') != '0':
+    try:
+        import orjson  # type: ignore
+    except ImportError:
+        pass
+
 MYPY=False
 if MYPY:
     # MYPY is True when mypy is running
@@ -64,15 +72,13 @@ if MYPY:
 # pylint: disable=invalid-name
 
 CO_GENERATOR = inspect.CO_GENERATOR  # type: ignore
+CO_VARARGS = inspect.CO_VARARGS  # type: ignore
 
 
 def _my_hash(arg_list):
     # type: (List[Any]) -> int
     """Simple helper hash function"""
-    res = 0
-    for arg in arg_list:
-        res = res * 31 + hash(arg)
-    return res
+    return hash(tuple(arg_list))
 
 
 # JSON object representing the collected data for a single function/method
@@ -133,7 +139,7 @@ class DictType(object):
 
     def __repr__(self):
         # type: () -> str
-        if repr(self.key_type) == 'None':
+        if self.key_type.is_none():
             # We didn't see any values, so we don't know what's inside
             return 'Dict'
         else:
@@ -166,7 +172,7 @@ class ListType(object):
 
     def __repr__(self):
         # type: () -> str
-        if repr(self.val_type) == 'None':
+        if self.val_type.is_none():
             # We didn't see any values, so we don't know what's inside
             return 'List'
         else:
@@ -199,7 +205,7 @@ class SetType(object):
 
     def __repr__(self):
         # type: () -> str
-        if repr(self.val_type) == 'None':
+        if self.val_type.is_none():
             # We didn't see any values, so we don't know what's inside
             return 'Set'
         else:
@@ -232,7 +238,7 @@ class IteratorType(object):
 
     def __repr__(self):
         # type: () -> str
-        if repr(self.val_type) == 'None':
+        if self.val_type.is_none():
             # We didn't see any values, so we don't know what's inside
             return 'Iterator'
         else:
@@ -261,7 +267,7 @@ class TupleType(object):
 
     def __init__(self, val_types):
         #  type: (List[InternalType]) -> None
-        self.val_types = val_types
+        self.val_types = tuple(val_types)  # type: Tuple[InternalType, ...]
 
     def __repr__(self):
         # type: () -> str
@@ -269,21 +275,14 @@ class TupleType(object):
 
     def __hash__(self):
         # type: () -> int
-        return _my_hash(self.val_types)
+        return hash(self.val_types)
 
     def __eq__(self, other):
         # type: (object) -> bool
         if not isinstance(other, TupleType):
             return False
 
-        if len(self.val_types) != len(other.val_types):
-            return False
-
-        for i, v in enumerate(self.val_types):
-            if v != other.val_types[i]:
-                return False
-
-        return True
+        return self.val_types == other.val_types
 
     def __ne__(self, other):
         # type: (object) -> bool
@@ -295,11 +294,14 @@ class TentativeType(object):
     This class serves as internal representation of type for a type collection process.
     It can be merged with another instance of TentativeType to build up a broader sample.
     """
+    __slots__ = ('types_hashable', 'types', '_dict_by_key')
 
     def __init__(self):
         # type: () -> None
         self.types_hashable = set()  # type: Set[InternalType]
         self.types = []  # type: List[InternalType]
+        # The DictType items of types_hashable, keyed by their (hashable) key types.
+        self._dict_by_key = {}  # type: Dict[FrozenSet[InternalType], DictType]
 
     def __hash__(self):
         # type: () -> int
@@ -339,23 +341,22 @@ class TentativeType(object):
         Add type to the runtime type samples.
         """
         try:
-            if isinstance(type, SetType):
-                if EMPTY_SET_TYPE in self.types_hashable:
-                    self.types_hashable.remove(EMPTY_SET_TYPE)
-            elif isinstance(type, ListType):
-                if EMPTY_LIST_TYPE in self.types_hashable:
-                    self.types_hashable.remove(EMPTY_LIST_TYPE)
-            elif isinstance(type, IteratorType):
-                if EMPTY_ITERATOR_TYPE in self.types_hashable:
-                    self.types_hashable.remove(EMPTY_ITERATOR_TYPE)
-            elif isinstance(type, DictType):
-                if EMPTY_DICT_TYPE in self.types_hashable:
-                    self.types_hashable.remove(EMPTY_DICT_TYPE)
-                for item in self.types_hashable:
-                    if isinstance(item, DictType):
-                        if item.key_type == type.key_type:
-                            item.val_type.merge(type.val_type)
-                            return
+            empty = _EMPTY_CONTAINER_TYPES.get(type.__class__)
+            if empty is not None and empty in self.types_hashable:
+                self.types_hashable.remove(empty)
+                if empty is EMPTY_DICT_TYPE:
+                    self._dict_by_key.pop(frozenset(), None)
+            if empty is EMPTY_DICT_TYPE:
+                assert isinstance(type, DictType)  # this line helps mypy figure out types
+                # If the key type has unhashable types, so does any equal key type;
+                # neither can be in types_hashable, and adding it fails below.
+                if not type.key_type.types:
+                    key = frozenset(type.key_type.types_hashable)
+                    item = self._dict_by_key.get(key)
+                    if item is not None:
+                        item.val_type.merge(type.val_type)
+                        return
+                    self._dict_by_key[key] = type
             self.types_hashable.add(type)
 
         except (TypeError, AttributeError):
@@ -376,10 +377,30 @@ class TentativeType(object):
         for non_hashbles in other.types:
             self.add(non_hashbles)
 
+    def is_none(self):
+        # type: () -> bool
+        """
+        Return True if this is rendered as 'None', i.e. if no types or only None were seen.
+        """
+        return (not self.types and not self.types_hashable) or (
+            len(self.types_hashable) == 1 and _NONE_TYPE in self.types_hashable)
+
     def __repr__(self):
         # type: () -> str
-        if (len(self.types) + len(self.types_hashable) == 0) or (
-                len(self.types_hashable) == 1 and _NONE_TYPE in self.types_hashable):
+        cache = _dump_repr_cache
+        if cache is None:
+            return self._repr()
+        key = id(self)
+        entry = cache.get(key)
+        if entry is not None and entry[0] is self:
+            return entry[1]
+        result = self._repr()
+        cache[key] = (self, result)
+        return result
+
+    def _repr(self):
+        # type: () -> str
+        if self.is_none():
             return 'None'
         else:
             type_format = '%s'
@@ -394,6 +415,12 @@ class TentativeType(object):
                     'Union[' + ', '.join(sorted([name_from_type(s) for s in filtered_types])) + ']')
 
 
+# While dumping (see _dumping()), the reprs of TentativeType instances computed
+# so far, keyed by id(). The entries also hold the instances, which keeps them
+# alive so that their IDs can't be reused by other instances while dumping.
+_dump_repr_cache = None  # type: Optional[Dict[int, Tuple[TentativeType, str]]]
+
+
 FunctionKey = NamedTuple('FunctionKey', [('path', str), ('line', int), ('func_name', str)])
 
 # Inferred types for a function call
@@ -401,12 +428,6 @@ ResolvedTypes = NamedTuple('ResolvedTypes',
                            [('pos_args', List[InternalType]),
                             ('varargs', Optional[List[InternalType]])])
 
-# Task queue entry for calling a function with specific argument types
-KeyAndTypes = NamedTuple('KeyAndTypes', [('key', FunctionKey), ('types', ResolvedTypes)])
-
-# Task queue entry for returning from a function with a value
-KeyAndReturn = NamedTuple('KeyAndReturn', [('key', FunctionKey), ('return_type', InternalType)])
-
 # Combined argument and return types for a single function call
 Signature = NamedTuple('Signature', [('args', 'ArgTypes'), ('return_type', InternalType)])
 
@@ -414,6 +435,11 @@ Signature = NamedTuple('Signature', [('args', 'ArgTypes'), ('return_type', Inter
 BUILTIN_MODULES = {'__builtin__', 'builtins', 'exceptions'}
 
 
+# Names of plain types computed by name_from_type(). This holds references to
+# the types, so it's cleared by reset_state() and init_types_collection().
+_type_name_cache = {}  # type: Dict[type, str]
+
+
 def name_from_type(type_):
     # type: (InternalType) -> str
     """
@@ -422,19 +448,32 @@ def name_from_type(type_):
     if isinstance(type_, (DictType, ListType, TupleType, SetType, IteratorType)):
         return repr(type_)
     else:
-        if type_.__name__ != 'NoneType':
-            module = type_.__module__
-            if module in BUILTIN_MODULES or module == '<unknown>':
-                # Omit module prefix for known built-ins, for convenience. This
-                # makes unit tests for this module simpler.
-                # Also ignore '<unknown>' modules so pyannotate can parse these types
-                return type_.__name__
-            else:
-                name = getattr(type_, '__qualname__', None) or type_.__name__
-                delim = '.' if '.' not in name else ':'
-                return '%s%s%s' % (module, delim, name)
+        try:
+            return _type_name_cache[type_]
+        except KeyError:
+            name = _type_name_cache[type_] = _name_from_plain_type(type_)
+            return name
+        except TypeError:
+            # The metaclass made the type unhashable.
+            return _name_from_plain_type(type_)
+
+
+def _name_from_plain_type(type_):
+    # type: (type) -> str
+    """Implementation of name_from_type() for types other than our internal ones."""
+    if type_.__name__ != 'NoneType':
+        module = type_.__module__
+        if module in BUILTIN_MODULES or module == '<unknown>':
+            # Omit module prefix for known built-ins, for convenience. This
+            # makes unit tests for this module simpler.
+            # Also ignore '<unknown>' modules so pyannotate can parse these types
+            return type_.__name__
         else:
-            return 'None'
+            name = getattr(type_, '__qualname__', None) or type_.__name__
+            delim = '.' if '.' not in name else ':'
+            return '%s%s%s' % (module, delim, name)
+    else:
+        return 'None'
 
 
 EMPTY_DICT_TYPE = DictType(TentativeType(), TentativeType())
@@ -442,8 +481,15 @@ EMPTY_LIST_TYPE = ListType(TentativeType())
 EMPTY_SET_TYPE = SetType(TentativeType())
 EMPTY_ITERATOR_TYPE = IteratorType(TentativeType())
 
+# Used by TentativeType.add() to find the empty instance of a container type.
+_EMPTY_CONTAINER_TYPES = {
+    DictType: EMPTY_DICT_TYPE,
+    ListType: EMPTY_LIST_TYPE,
+    SetType: EMPTY_SET_TYPE,
+    IteratorType: EMPTY_ITERATOR_TYPE,
+}  # type: Dict[Any, InternalType]
+
 
-# TODO: Make this faster
 def get_function_name_from_frame(frame):
     # type: (Any) -> str
     """
@@ -452,6 +498,50 @@ def get_function_name_from_frame(frame):
     For instance methods we return "ClassName.method_name"
     For functions we return "function_name"
     """
+    return _get_function_name(frame.f_code, _get_self(frame))
+
+
+def _get_self(frame):
+    # type: (Any) -> Any
+    """Return the 'self' argument of a method's frame, or None."""
+    code = frame.f_code
+    if code.co_varnames and code.co_varnames[0] == 'self':
+        return frame.f_locals.get('self')
+    return None
+
+
+# Cache for _get_function_key(), keyed by the IDs of the code object and of the
+# class of 'self' (0 for functions). The entries also hold the code object and
+# the class, which keeps them alive so that their IDs can't be reused by other
+# objects while the entry exists. Cleared by start() and init_types_collection().
+_function_key_cache = {}  # type: Dict[Tuple[int, int], Tuple[Any, Any, Optional[FunctionKey]]]
+
+
+def _get_function_key(frame):
+    # type: (Any) -> Optional[FunctionKey]
+    """
+    Return the FunctionKey for a frame, or None if we're not interested in the function.
+    """
+    inst = _get_self(frame)
+    code = frame.f_code
+    cls = None if inst is None else inst.__class__
+    cache_key = (id(code), 0 if cls is None else id(cls))
+    entry = _function_key_cache.get(cache_key)
+    if entry is not None and entry[0] is code and entry[1] is cls:
+        return entry[2]
+    function_key = None
+    filename = _filter_filename(code.co_filename)
+    if filename:
+        func_name = _get_function_name(code, inst)
+        if func_name and func_name[0] != '<':
+            function_key = FunctionKey(filename, code.co_firstlineno, func_name)
+    _function_key_cache[cache_key] = (code, cls, function_key)
+    return function_key
+
+
+def _get_function_name(code, inst):
+    # type: (Any, Any) -> str
+    """Implementation of get_function_name_from_frame()."""
 
     def bases_to_mro(cls, bases):
         # type: (type, List[type]) -> List[type]
@@ -469,29 +559,23 @@ def get_function_name_from_frame(frame):
                     mro.extend(bases_to_mro(base, sub_bases))
         return mro
 
-    code = frame.f_code
-    # This ought to be aggressively cached with the code object as key.
     funcname = code.co_name
-    if code.co_varnames:
-        varname = code.co_varnames[0]
-        if varname == 'self':
-            inst = frame.f_locals.get(varname)
-            if inst is not None:
-                try:
-                    mro = inst.__class__.__mro__
-                except AttributeError:
-                    mro = None
-                    try:
-                        bases = inst.__class__.__bases__
-                    except AttributeError:
-                        bases = None
-                    else:
-                        mro = bases_to_mro(inst.__class__, bases)
-                if mro:
-                    for cls in mro:
-                        bare_method = cls.__dict__.get(funcname)
-                        if bare_method and getattr(bare_method, '__code__', None) is code:
-                            return '%s.%s' % (cls.__name__, funcname)
+    if inst is not None:
+        try:
+            mro = inst.__class__.__mro__
+        except AttributeError:
+            mro = None
+            try:
+                bases = inst.__class__.__bases__
+            except AttributeError:
+                bases = None
+            else:
+                mro = bases_to_mro(inst.__class__, bases)
+        if mro:
+            for cls in mro:
+                bare_method = cls.__dict__.get(funcname)
+                if bare_method and getattr(bare_method, '__code__', None) is code:
+                    return '%s.%s' % (cls.__name__, funcname)
     return funcname
 
 
@@ -549,32 +633,35 @@ def resolve_type(arg):
         return type(arg)
 
 
-def prep_args(arg_info):
-    # type: (ArgInfo) -> ResolvedTypes
-    """
-    Resolve types from ArgInfo
+def prep_args_from_frame(frame):
+    # type: (Any) -> ResolvedTypes
     """
+    Resolve argument types from a frame for a call event
 
-    # pull out any varargs declarations
-    filtered_args = [a for a in arg_info.args if getattr(arg_info, 'varargs', None) != a]
+    This reads the argument names straight from the code object, which is
+    much cheaper than going through inspect.getargvalues().
+    """
+    code = frame.f_code
+    # Keyword-only arguments (Python 3 only) follow the positional ones.
+    nargs = code.co_argcount + getattr(code, 'co_kwonlyargcount', 0)
+    arg_names = code.co_varnames[:nargs]
 
     # we don't care about self/cls first params (perhaps we can test if it's an instance/class method another way?)
-    if filtered_args and (filtered_args[0] in ('self', 'cls')):
-        filtered_args = filtered_args[1:]
+    if arg_names and (arg_names[0] in ('self', 'cls')):
+        arg_names = arg_names[1:]
 
+    f_locals = frame.f_locals
     pos_args = []  # type: List[InternalType]
-    if filtered_args:
-        for arg in filtered_args:
-            if isinstance(arg, str) and arg in arg_info.locals:
-                # here we know that return type will be of type "type"
-                resolved_type = resolve_type(arg_info.locals[arg])
-                pos_args.append(resolved_type)
-            else:
-                pos_args.append(type(UnknownType()))
+    for arg in arg_names:
+        # Python 2 tuple parameters get names like '.1'; we don't resolve those.
+        if arg in f_locals and arg[0] != '.':
+            pos_args.append(resolve_type(f_locals[arg]))
+        else:
+            pos_args.append(UnknownType)
 
     varargs = None  # type: Optional[List[InternalType]]
-    if arg_info.varargs:
-        varargs_tuple = arg_info.locals[arg_info.varargs]
+    if code.co_flags & CO_VARARGS:
+        varargs_tuple = f_locals.get(code.co_varnames[nargs])
         # It's unclear what all the possible values for 'varargs_tuple' are,
         # so perform a defensive type check since we don't want to crash here.
         if isinstance(varargs_tuple, tuple):
@@ -587,6 +674,7 @@ class ArgTypes(object):
     """
     Internal representation of argument types in a single call
     """
+    __slots__ = ('pos_args', 'varargs')
 
     def __init__(self, resolved_types):
         # type: (ResolvedTypes) -> None
@@ -622,18 +710,28 @@ class ArgTypes(object):
 # Collect at most this many type comments for each function.
 MAX_ITEMS_PER_FUNCTION = 8
 
-# The most recent argument types collected for each function. Once we encounter
-# a corresponding return event, an item will be flushed and moved to
-# 'collected_comments'.
-collected_args = {}  # type: Dict[FunctionKey, ArgTypes]
+class FunctionState(object):
+    """
+    Types collected for a single function.
+    """
+    __slots__ = ('args', 'signatures', 'num_samples')
+
+    def __init__(self):
+        # type: () -> None
+        # The most recent argument types collected. Once we encounter a
+        # corresponding return event, they will be flushed and moved to
+        # 'signatures'.
+        self.args = None  # type: Optional[ArgTypes]
+        # Collected unique signatures, used to generate type comments of form
+        # '(arg, ...) -> ret'. There are at most MAX_ITEMS_PER_FUNCTION items.
+        self.signatures = set()  # type: Set[Tuple[ArgTypes, InternalType]]
+        # Number of samples collected (we also count ones ignored after reaching
+        # the maximum comment count).
+        self.num_samples = 0
 
-# Collected unique type comments for each function, of form '(arg, ...) -> ret'.
-# There at most MAX_ITEMS_PER_FUNCTION items.
-collected_signatures = {}  # type: Dict[FunctionKey, Set[Tuple[ArgTypes, InternalType]]]
 
-# Number of samples collected per function (we also count ones ignored after reaching
-# the maximum comment count per function).
-num_samples = {}  # type: Dict[FunctionKey, int]
+# Everything collected so far, per function.
+function_states = {}  # type: Dict[FunctionKey, FunctionState]
 
 
 def _make_type_comment(args_info, return_type):
@@ -653,53 +751,52 @@ def _make_type_comment(args_info, return_type):
     return '(%s) -> %s' % (args_string, return_name)
 
 
-def _flush_signature(key, return_type):
-    # type: (FunctionKey, InternalType) -> None
+def _flush_signature(state, return_type):
+    # type: (FunctionState, InternalType) -> None
     """Store signature for a function.
 
     Assume that argument types have been stored previously to
-    'collected_args'. As the 'return_type' argument provides the return
+    'state.args'. As the 'return_type' argument provides the return
     type, we now have a complete signature.
 
-    As a side effect, removes the argument types for the function from
-    'collected_args'.
-    """
-    signatures = collected_signatures.setdefault(key, set())
-    args_info = collected_args.pop(key)
-    if len(signatures) < MAX_ITEMS_PER_FUNCTION:
-        signatures.add((args_info, return_type))
-    num_samples[key] = num_samples.get(key, 0) + 1
-
-
-def type_consumer():
-    # type: () -> None
+    As a side effect, clears 'state.args'.
     """
-    Infinite loop of the type consumer thread.
-    It gets types to process from the task query.
-    """
-
-    # we are not interested in profiling type_consumer itself
-    # but we start it before any other thread
-    while True:
-        item = _task_queue.get()
-        if isinstance(item, KeyAndTypes):
-            if item.key in collected_args:
-                # Previous call didn't get a corresponding return, perhaps because we
-                # stopped collecting types in the middle of a call or because of
-                # a recursive function.
-                _flush_signature(item.key, UnknownType)
-            collected_args[item.key] = ArgTypes(item.types)
-        else:
-            assert isinstance(item, KeyAndReturn)
-            if item.key in collected_args:
-                _flush_signature(item.key, item.return_type)
-        _task_queue.task_done()
-
+    assert state.args is not None
+    if len(state.signatures) < MAX_ITEMS_PER_FUNCTION:
+        state.signatures.add((state.args, return_type))
+    state.args = None
+    state.num_samples += 1
+
+
+# Protects function_states, which is updated directly from the profiler hook
+# of whichever thread is running.
+_collected_lock = threading.Lock()
+
+
+def _record_call(key, resolved_types):
+    # type: (FunctionKey, ResolvedTypes) -> None
+    """Store argument types for a call, until the corresponding return is seen."""
+    args_info = ArgTypes(resolved_types)
+    with _collected_lock:
+        state = function_states.get(key)
+        if state is None:
+            state = function_states[key] = FunctionState()
+        elif state.args is not None:
+            # Previous call didn't get a corresponding return, perhaps because we
+            # stopped collecting types in the middle of a call or because of
+            # a recursive function.
+            _flush_signature(state, UnknownType)
+        state.args = args_info
+
+
+def _record_return(key, return_type):
+    # type: (FunctionKey, InternalType) -> None
+    """Complete the signature of a call recorded by _record_call()."""
+    with _collected_lock:
+        state = function_states.get(key)
+        if state is not None and state.args is not None:
+            _flush_signature(state, return_type)
 
-_task_queue = Queue()  # type: Queue[Union[KeyAndTypes, KeyAndReturn]]
-_consumer_thread = Thread(target=type_consumer)
-_consumer_thread.daemon = True
-_consumer_thread.start()
 
 running = False
 
@@ -763,7 +860,6 @@ def stop():
     """
     global running  # pylint: disable=global-statement
     running = False
-    _task_queue.join()
 
 
 def resume():
@@ -782,6 +878,20 @@ def start():
     global running  # pylint: disable=global-statement
     running = True
     sampling_counters.clear()
+    _function_key_cache.clear()
+
+
+def reset_state():
+    # type: () -> None
+    """
+    Discard all collected type information.
+    """
+    with _collected_lock:
+        function_states.clear()
+    sampling_counters.clear()
+    call_pending.clear()
+    _function_key_cache.clear()
+    _type_name_cache.clear()
 
 
 def default_filter_filename(filename):
@@ -861,46 +971,39 @@ def _trace_dispatch(frame, event, arg):
         # Ignore other events, such as c_call and c_return.
         return
 
-    # Track calls under current directory only.
-    filename = _filter_filename(code.co_filename)
-    if filename:
-        func_name = get_function_name_from_frame(frame)
-        if not func_name or func_name[0] == '<':
-            # Could be a lambda or a comprehension; we're not interested.
-            sampling_counters[key] = None
-        else:
-            function_key = FunctionKey(filename, code.co_firstlineno, func_name)
-            if event == 'call':
-                # TODO(guido): Make this faster
-                arg_info = inspect.getargvalues(frame)  # type: ArgInfo
-                resolved_types = prep_args(arg_info)
-                _task_queue.put(KeyAndTypes(function_key, resolved_types))
-            elif event == 'return':
-                # This event is also triggered if a function yields or raises an exception.
-                # We can tell the difference by looking at the bytecode.
-                # (We don't get here for C functions so the bytecode always exists.)
-                last_opcode = code.co_code[frame.f_lasti]
-                if last_opcode == RETURN_VALUE_OPCODE:
-                    if code.co_flags & CO_GENERATOR:
-                        # Return from a generator.
-                        t = resolve_type(FakeIterator([]))
-                    else:
-                        t = resolve_type(arg)
-                elif last_opcode == YIELD_VALUE_OPCODE:
-                    # Yield from a generator.
-                    # TODO: Unify generators -- currently each YIELD is turned into
-                    # a separate call, so a function yielding ints and strs will be
-                    # typed as Union[Iterator[int], Iterator[str]] -- this should be
-                    # Iterator[Union[int, str]].
-                    t = resolve_type(FakeIterator([arg]))
-                else:
-                    # This branch is also taken when returning from a generator.
-                    # TODO: returning non-trivial values from generators, per PEP 380;
-                    # and async def / await stuff.
-                    t = NoReturnType
-                _task_queue.put(KeyAndReturn(function_key, t))
-    else:
+    # Track calls under current directory only; skip lambdas and comprehensions.
+    function_key = _get_function_key(frame)
+    if function_key is None:
         sampling_counters[key] = None  # We're not interested in this function.
+        return
+
+    if event == 'call':
+        resolved_types = prep_args_from_frame(frame)
+        _record_call(function_key, resolved_types)
+    elif event == 'return':
+        # This event is also triggered if a function yields or raises an exception.
+        # We can tell the difference by looking at the bytecode.
+        # (We don't get here for C functions so the bytecode always exists.)
+        last_opcode = code.co_code[frame.f_lasti]
+        if last_opcode == RETURN_VALUE_OPCODE:
+            if code.co_flags & CO_GENERATOR:
+                # Return from a generator.
+                t = resolve_type(FakeIterator([]))
+            else:
+                t = resolve_type(arg)
+        elif last_opcode == YIELD_VALUE_OPCODE:
+            # Yield from a generator.
+            # TODO: Unify generators -- currently each YIELD is turned into
+            # a separate call, so a function yielding ints and strs will be
+            # typed as Union[Iterator[int], Iterator[str]] -- this should be
+            # Iterator[Union[int, str]].
+            t = resolve_type(FakeIterator([arg]))
+        else:
+            # This branch is also taken when returning from a generator.
+            # TODO: returning non-trivial values from generators, per PEP 380;
+            # and async def / await stuff.
+            t = NoReturnType
+        _record_return(function_key, t)
 
 
 T = TypeVar('T')
@@ -918,25 +1021,56 @@ def _filter_types(types_dict):
     return {k: v for k, v in iteritems(types_dict) if not exclude(k)}
 
 
-def _dump_impl():
-    # type: () -> List[FunctionData]
-    """Internal implementation for dump_stats and dumps_stats"""
-    filtered_signatures = _filter_types(collected_signatures)
-    sorted_by_file = sorted(iteritems(filtered_signatures),
+@contextmanager
+def _dumping():
+    # type: () -> Iterator[None]
+    """Context manager to enable the TentativeType repr cache while dumping."""
+    global _dump_repr_cache  # pylint: disable=global-statement
+    _dump_repr_cache = {}
+    try:
+        yield
+    finally:
+        _dump_repr_cache = None
+
+
+def _iter_dump():
+    # type: () -> Iterator[FunctionData]
+    """Generate the collected information one function at a time."""
+    filtered_states = _filter_types(function_states)
+    sorted_by_file = sorted(iteritems(filtered_states),
                             key=(lambda p: (p[0].path, p[0].line, p[0].func_name)))
-    res = []  # type: List[FunctionData]
-    for function_key, signatures in sorted_by_file:
-        comments = [_make_type_comment(args, ret_type) for args, ret_type in signatures]
-        res.append(
-            {
-                'path': function_key.path,
-                'line': function_key.line,
-                'func_name': function_key.func_name,
-                'type_comments': comments,
-                'samples': num_samples.get(function_key, 0),
-            }
-        )
-    return res
+    for function_key, state in sorted_by_file:
+        if not state.signatures:
+            # Called, but we haven't seen a return yet.
+            continue
+        comments = [_make_type_comment(args, ret_type) for args, ret_type in state.signatures]
+        yield {
+            'path': function_key.path,
+            'line': function_key.line,
+            'func_name': function_key.func_name,
+            'type_comments': comments,
+            'samples': state.num_samples,
+        }
+
+
+_encode_string = json.encoder.encode_basestring_ascii  # type: Callable[[str], str]
+
+
+def _encode_function_data(item):
+    # type: (FunctionData) -> str
+    """
+    Encode a FunctionData item as compact JSON.
+
+    This gives the same result as json.dumps(item, separators=(',', ':')), but
+    is much faster since it knows the schema in advance.
+    """
+    return '{"path":%s,"line":%d,"func_name":%s,"type_comments":[%s],"samples":%d}' % (
+        _encode_string(item['path']),
+        item['line'],
+        _encode_string(item['func_name']),
+        ','.join([_encode_string(comment) for comment in item['type_comments']]),
+        item['samples'],
+    )
 
 
 def dump_stats(filename):
@@ -947,19 +1081,28 @@ def dump_stats(filename):
     Args:
         filename: absolute filename
     """
-    res = _dump_impl()
-    f = open(filename, 'w')
-    json.dump(res, f, indent=4)
-    f.close()
+    # Write one function per line as we go, so we never hold the JSON for
+    # all functions in memory.  orjson is much faster than the json module.
+    with _dumping(), open(filename, 'wb') as f:
+        f.write(b'[')
+        sep = b'\n'
+        for item in _iter_dump():
+            f.write(sep)
+            if orjson is not None:
+                f.write(orjson.dumps(item))
+            else:
+                f.write(_encode_function_data(item).encode('ascii'))
+            sep = b',\n'
+        f.write(b'\n]\n')
 
 
 def dumps_stats():
     # type: () -> str
     """
-    Return collected information as a json string.
+    Return collected information as a compact json string.
     """
-    res = _dump_impl()
-    return json.dumps(res, indent=4)
+    with _dumping():
+        return '[%s]' % ','.join([_encode_function_data(item) for item in _iter_dump()])
 
 
 def init_types_collection(filter_filename=default_filter_filename):
@@ -974,6 +1117,8 @@ def init_types_collection(filter_filename=default_filter_filename):
     """
     global _filter_filename
     _filter_filename = filter_filename
+    _function_key_cache.clear()
+    _type_name_cache.clear()
     sys.setprofile(_trace_dispatch)
     threading.setprofile(_trace_dispatch)
 
@@ -5,14 +5,14 @@ from __future__ import (
     print_function,
 )
 
-import contextlib
 import json
 import os
 import sched
 import sys
+import tempfile
 import time
 import unittest
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from threading import Thread
 
 from six import PY2
@@ -182,6 +182,24 @@ def two_dict_comprehensions():
     }
 
 
+class CollectingTypes(object):
+    """Context manager that collects types and loads the stats into a test."""
+
+    def __init__(self, test):
+        # type: (TestBaseClass) -> None
+        self.test = test
+
+    def __enter__(self):
+        # type: () -> None
+        collect_types.reset_state()
+        collect_types.start()
+
+    def __exit__(self, *exc_info):
+        # type: (*Any) -> None
+        collect_types.stop()
+        self.test.load_stats()
+
+
 class TestBaseClass(unittest.TestCase):
 
     def setUp(self):
@@ -198,18 +216,9 @@ class TestBaseClass(unittest.TestCase):
         # type: () -> None
         self.stats = json.loads(collect_types.dumps_stats())
 
-    @contextlib.contextmanager
     def collecting_types(self):
-        # type: () -> Iterator[None]
-        collect_types.collected_args = {}
-        collect_types.collected_signatures = {}
-        collect_types.num_samples = {}
-        collect_types.sampling_counters = {}
-        collect_types.call_pending = set()
-        collect_types.start()
-        yield None
-        collect_types.stop()
-        self.load_stats()
+        # type: () -> CollectingTypes
+        return CollectingTypes(self)
 
     def assert_type_comments(self, func_name, comments):
         # type: (str, List[str]) -> None
@@ -220,16 +229,18 @@ class TestBaseClass(unittest.TestCase):
             return
         assert len(stat_items) == 1
         item = stat_items[0]
-        if set(item['type_comments']) != set(comments):
+        actual = sorted(item['type_comments'])
+        expected = sorted(comments)
+        if actual != expected:
             print('Actual:')
-            for comment in sorted(item['type_comments']):
+            for comment in actual:
                 print('    ' + comment)
             print('Expected:')
-            for comment in sorted(comments):
+            for comment in expected:
                 print('    ' + comment)
-            assert set(item['type_comments']) == set(comments)
-        assert len(item['type_comments']) == len(comments)
-        assert os.path.join(collect_types.TOP_DIR, item['path']) == __file__
+            assert False, 'Type comments differ'
+        # TOP_DIR ends with a separator and the collected path is relative to it.
+        assert collect_types.TOP_DIR + item['path'] == __file__
 
 
 class TestCollectTypes(TestBaseClass):
@@ -354,6 +365,98 @@ class TestCollectTypes(TestBaseClass):
                 'problematic_dup',
                 ['(str, bool) -> Tuple[Dict[str, Union[List, int, str]], bytes]'])
 
+    def test_dump_stats(self):
+        # type: () -> None
+        with self.collecting_types():
+            self.foo(2, ['1', '2'])
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        orjson = collect_types.orjson
+        try:
+            # Check both with and without the optional orjson module.
+            for module in orjson, None:
+                collect_types.orjson = module
+                collect_types.dump_stats(filename)
+                with open(filename) as f:
+                    assert json.load(f) == self.stats
+        finally:
+            collect_types.orjson = orjson
+            os.remove(filename)
+
+    def test_method_names(self):
+        # type: () -> None
+
+        class Base(object):
+            def inherited(self, x):
+                # type: (Any) -> Any
+                return x
+
+            def overridden(self, x):
+                # type: (Any) -> Any
+                return x
+
+        class Derived(Base):
+            def overridden(self, x):
+                # type: (Any) -> Any
+                return x
+
+        with self.collecting_types():
+            for obj in Base(), Derived(), Base():
+                obj.inherited(1)
+                obj.overridden('x')
+        self.assert_type_comments('Base.inherited', ['(int) -> int'])
+        self.assert_type_comments('Base.overridden', ['(str) -> str'])
+        self.assert_type_comments('Derived.overridden', ['(str) -> str'])
+        assert not [item for item in self.stats if item['func_name'] == 'Derived.inherited']
+
+    def test_function_key_cache_id_reuse(self):
+        # type: () -> None
+        with self.collecting_types():
+            # Pretend that a code object that has since been freed had the
+            # same ID as the code of print_int().
+            stale_key = collect_types.FunctionKey('stale.py', 1, 'stale')
+            collect_types._function_key_cache[(id(print_int.__code__), 0)] = (
+                object(), None, stale_key)
+            print_int(1)
+        self.assert_type_comments('print_int', ['(int) -> None'])
+        assert not [item for item in self.stats if item['func_name'] == 'stale']
+
+    def test_dump_repr_cache_id_reuse(self):
+        # type: () -> None
+        typ = collect_types.TentativeType()
+        typ.add(int)
+        with collect_types._dumping():
+            # Pretend that an instance that has since been freed had the same
+            # ID as typ.
+            cache = collect_types._dump_repr_cache
+            assert cache is not None
+            cache[id(typ)] = (collect_types.TentativeType(), 'str')
+            assert repr(typ) == 'int'
+            assert repr(typ) == 'int'
+
+    def test_reset_state_clears_type_names(self):
+        # type: () -> None
+        class Local(object):
+            pass
+        collect_types.name_from_type(Local)
+        assert Local in collect_types._type_name_cache
+        collect_types.reset_state()
+        assert Local not in collect_types._type_name_cache
+
+    def test_encode_function_data(self):
+        # type: () -> None
+        for comments in [u'(int) -> None', u'(\x00) -> Dict[str, "x"]'], []:
+            # An OrderedDict since the expected output depends on the key order.
+            item = OrderedDict([
+                ('path', u'p\u00e4th/"quoted"\\.py'),
+                ('line', 42),
+                ('func_name', u'f\n\u2603'),
+                ('type_comments', comments),
+                ('samples', 3),
+            ])
+            encoded = collect_types._encode_function_data(item)  # type: ignore
+            assert encoded == json.dumps(item, separators=(',', ':'))
+
     def test_two_signatures(self):
         # type: () -> None
 
@@ -415,6 +518,19 @@ class TestCollectTypes(TestBaseClass):
         self.assert_type_comments('func_kw', ['(str, int) -> str',
                                               '(float, None) -> float'])
 
+    @unittest.skipIf(PY2, 'Keyword-only arguments require Python 3')
+    def test_keyword_only_args(self):
+        # type: () -> None
+        ns = {}  # type: Dict[str, Any]
+        exec(compile('def func_kw_only(x, *args, y): return x\n', __file__, 'exec'), ns)
+        func_kw_only = ns['func_kw_only']
+
+        with self.collecting_types():
+            func_kw_only(1, 'a', 'b', y=1.1)
+            func_kw_only('', y=None)
+        self.assert_type_comments('func_kw_only', ['(int, float, *str) -> int',
+                                                   '(str, None) -> str'])
+
     def test_no_return(self):
         # type: () -> None
 
@@ -499,6 +615,18 @@ class TestCollectTypes(TestBaseClass):
         self.assert_type_comments('caller_star_args', ['(int, None) -> int',
                                                        '(str, float) -> int'])
 
+    def test_list_of_dicts(self):
+        # type: () -> None
+
+        def list_of_dicts(x):
+            # type: (Any) -> Any
+            return 0
+
+        with self.collecting_types():
+            list_of_dicts([{}, {1: 'a'}, {'x': 1}, {2: None}])
+        self.assert_type_comments('list_of_dicts',
+                                  ['(List[Union[Dict[int, Optional[str]], Dict[str, int]]]) -> int'])
+
     def test_star_star_args(self):
         # type: () -> None
 
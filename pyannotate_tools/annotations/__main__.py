@@ -1,17 +1,16 @@
 from __future__ import print_function
 
 import argparse
-import json
 import logging
 import os
 import sys
 
-from lib2to3.main import StdoutRefactoringTool
-
 from typing import Any, Dict, List, Optional
 
-from pyannotate_tools.annotations.main import generate_annotations_json_string, unify_type_comments
-from pyannotate_tools.fixes.fix_annotate_json import FixAnnotateJson
+from pyannotate_tools.annotations import fastjson
+from pyannotate_tools.annotations.main import (_imap_in_processes, generate_annotations_from_file,
+                                               unify_type_comments)
+from pyannotate_tools.annotations.parse import iter_json_file
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--type-info', default='type_info.json', metavar="FILE",
@@ -48,43 +47,34 @@ parser.add_argument('--py3', '-3', action='store_const', dest='python_version',
                     help="Annotate for Python 3 with argument and return value annotations")
 
 
-class ModifiedRefactoringTool(StdoutRefactoringTool):
-    """Class that gives a nicer error message for bad encodings."""
-
-    def refactor_file(self, filename, write=False, doctests_only=False):
-        try:
-            super(ModifiedRefactoringTool, self).refactor_file(
-                filename, write=write, doctests_only=doctests_only)
-        except SyntaxError as err:
-            if str(err).startswith("unknown encoding:"):
-                self.log_error("Can't parse %s: %s", filename, err)
-            else:
-                raise
-
-
-def dump_annotations(type_info, files):
+def dump_annotations(type_info, files, processes=1):
     """Dump annotations out of type_info, filtered by files.
 
     If files is non-empty, only dump items either if the path in the
     item matches one of the files exactly, or else if one of the files
     is a path prefix of the path.
+
+    If processes is more than 1, infer the signatures in that many
+    worker processes.
     """
-    with open(type_info) as f:
-        data = json.load(f)
-    for item in data:
-        path, line, func_name = item['path'], item['line'], item['func_name']
-        if files and path not in files:
-            for f in files:
-                if path.startswith(os.path.join(f, '')):
-                    break
-            else:
-                continue  # Outer loop
-        print("%s:%d: in %s:" % (path, line, func_name))
-        type_comments = item['type_comments']
-        signature = unify_type_comments(type_comments)
-        arg_types = signature['arg_types']
-        return_type = signature['return_type']
-        print("    # type: (%s) -> %s" % (", ".join(arg_types), return_type))
+    exact = frozenset(files)
+    prefixes = tuple(os.path.join(f, '') for f in files)
+    with open(type_info, 'rb') as f:
+        # Read and decode one item at a time instead of holding all of them
+        # in memory.
+        items = (item for item in iter_json_file(f, type_info)
+                 if not files or item['path'] in exact or item['path'].startswith(prefixes))
+        for line in _imap_in_processes(_format_annotation, items, processes):
+            print(line)
+
+
+def _format_annotation(item):
+    # type: (Dict[str, Any]) -> str
+    """Format the inferred signature of a type_info item for dump_annotations()."""
+    signature = unify_type_comments(item['type_comments'])
+    return "%s:%d: in %s:\n    # type: (%s) -> %s" % (
+        item['path'], item['line'], item['func_name'],
+        ", ".join(signature['arg_types']), signature['return_type'])
 
 
 def main(args_override=None):
@@ -105,26 +95,29 @@ def main(args_override=None):
     logging.basicConfig(format='%(message)s', level=level)
 
     if args.dump:
-        dump_annotations(args.type_info, args.files)
+        dump_annotations(args.type_info, args.files, args.processes)
         return
 
+    # Importing lib2to3 loads its grammar, which is slow; --dump doesn't need it.
+    from pyannotate_tools.annotations.refactor import ModifiedRefactoringTool
+    from pyannotate_tools.fixes.fix_annotate_json import FixAnnotateJson
+
     if args.auto_any:
         fixers = ['pyannotate_tools.fixes.fix_annotate']
     else:
         # Produce nice error message if type_info.json not found.
         try:
-            with open(args.type_info) as f:
-                contents = f.read()
+            f = open(args.type_info, 'rb')
         except IOError as err:
             sys.exit("Can't open type info file: %s" % err)
 
-        # Run pass 2 with output into a variable.
-        if args.uses_signature:
-            data = json.loads(contents)  # type: List[Any]
-        else:
-            data = generate_annotations_json_string(
-                args.type_info,
-                only_simple=args.only_simple)
+        # Run pass 2 with output into a variable.  Read the file only once.
+        with f:
+            if args.uses_signature:
+                data = fastjson.load(f)  # type: List[Any]
+            else:
+                data = generate_annotations_from_file(f, only_simple=args.only_simple,
+                                                      processes=args.processes)
 
         # Run pass 3 with input from that variable.
         FixAnnotateJson.init_stub_json_from_data(data, args.files[0])
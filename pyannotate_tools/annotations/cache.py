@@ -0,0 +1,118 @@
+"""Optional on-disk cache of annotations generated from type_info.json files.
+
+Generating annotations is deterministic in the contents of the input file,
+the only_simple flag and the code of this package, so the result for an
+unchanged input can be reused.  Set the PYANNOTATE_CACHE_DIR environment
+variable to a directory to enable the cache.  Entries are never removed
+automatically; delete the directory to clear the cache.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from typing import IO, Any, List, Optional
+
+from pyannotate_tools.annotations import fastjson
+
+CHUNK_SIZE = 1 << 16
+
+_code_digest = None  # type: Optional[bytes]
+
+
+def get_cache_dir():
+    # type: () -> Optional[str]
+    return os.environ.get('PYANNOTATE_CACHE_DIR') or None
+
+
+def get_key(source, only_simple):
+    # type: (IO[Any], bool) -> Optional[str]
+    """Return the cache key for generating annotations from a file object.
+
+    Return None if the cache is disabled or the file can't be read twice.
+    The file is left at the position where it was.
+    """
+    if get_cache_dir() is None:
+        return None
+    h = hashlib.sha256(_get_code_digest())
+    h.update(('only_simple=%d\n' % only_simple).encode('ascii'))
+    try:
+        start = source.tell()
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode('utf-8')
+            h.update(chunk)
+        source.seek(start)
+    except (AttributeError, IOError, OSError, ValueError):
+        # Not seekable.
+        return None
+    return h.hexdigest()
+
+
+def load(key):
+    # type: (str) -> Optional[List[Any]]
+    """Return the cached data for a key, or None if there is none."""
+    try:
+        with open(_get_path(key), 'rb') as f:
+            return fastjson.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save(key, data):
+    # type: (str, List[Any]) -> None
+    """Store data for a key, ignoring errors (the cache is just an optimization)."""
+    path = _get_path(key)
+    try:
+        cache_dir = os.path.dirname(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first, so that readers never see a partial entry.
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(data))
+            _replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    except (IOError, OSError):
+        pass
+
+
+def _replace(src, dst):
+    # type: (str, str) -> None
+    """Rename src to dst, replacing dst if it exists (os.rename() fails on Windows)."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        # Python 2 has no os.replace().
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _get_path(key):
+    # type: (str) -> str
+    cache_dir = get_cache_dir()
+    assert cache_dir is not None
+    return os.path.join(cache_dir, key + '.json')
+
+
+def _get_code_digest():
+    # type: () -> bytes
+    """Return a digest of the code that generates annotations."""
+    global _code_digest
+    if _code_digest is None:
+        h = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package_dir)):
+            if name.endswith('.py'):
+                with open(os.path.join(package_dir, name), 'rb') as f:
+                    h.update(f.read())
+        _code_digest = h.digest()
+    return _code_digest
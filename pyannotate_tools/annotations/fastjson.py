@@ -0,0 +1,34 @@
+"""Load JSON using orjson if it's available, else the json module.
+
+orjson is an optional dependency; it is much faster than the json module
+for the large type_info.json files written by collect_types.  Set the
+PYANNOTATE_FAST_JSON environment variable to 0 to always use the json module.
+"""
+
+import json
+import os
+
+from typing import Any, Union
+
+orjson = None  # type: Any
+if os.environ.get('PYANNOTATE_FAST_JSON') != '0':
+    try:
+        import orjson  # type: ignore
+    except ImportError:
+        pass
+
+
+def loads(data):
+    # type: (Union[bytes, str]) -> Any
+    """Parse JSON from a str or from UTF-8 encoded bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def load(f):
+    # type: (Any) -> Any
+    """Parse JSON from a file object opened in binary or text mode."""
+    return loads(f.read())
@@ -3,8 +3,11 @@
 The main entry point is 'infer_annotation'.
 """
 
+from collections import OrderedDict
+
 from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+from pyannotate_tools.annotations import parse
 from pyannotate_tools.annotations.parse import parse_type_comment
 from pyannotate_tools.annotations.types import (
     AbstractType,
@@ -18,12 +21,12 @@ from pyannotate_tools.annotations.types import (
     NoReturnType,
 )
 
-IGNORED_ITEMS = {
+IGNORED_ITEMS = frozenset([
     'unittest.mock.Mock',
     'unittest.mock.MagicMock',
     'mock.mock.Mock',
     'mock.mock.MagicMock',
-}
+])
 
 class InferError(Exception):
     """Raised if we can't infer a signature for some reason."""
@@ -39,16 +42,21 @@ def infer_annotation(type_comments):
     Returns: Tuple of (argument types and kinds, return type).
     """
     assert type_comments
-    args = {}  # type: Dict[int, Set[Argument]]
+    # Argument types by position. Positions are contiguous, so use a list.
+    args = []  # type: List[Set[Argument]]
     returns = set()
-    for comment in type_comments:
+    # Runtime-collected data often repeats the same comment; parse each
+    # distinct comment only once (keeping the original order).
+    for comment in OrderedDict.fromkeys(type_comments):
         arg_types, return_type = parse_type_comment(comment)
         for i, arg_type in enumerate(arg_types):
-            args.setdefault(i, set()).add(arg_type)
+            if i == len(args):
+                args.append(set())
+            args[i].add(arg_type)
         returns.add(return_type)
     combined_args = []
-    for i in sorted(args):
-        arg_infos = list(args[i])
+    for arg_set in args:
+        arg_infos = list(arg_set)
         kind = argument_kind(arg_infos)
         if kind is None:
             raise InferError('Ambiguous argument kinds:\n' + '\n'.join(type_comments))
@@ -58,7 +66,7 @@ def infer_annotation(type_comments):
             # It's very rare for an argument to actually be typed `None`, more likely than
             # not we simply don't have any data points for this argument.
             combined = UnionType([ClassType('None'), AnyType()])
-        if kind != ARG_POS and (len(str(combined)) > 120 or isinstance(combined, UnionType)):
+        if kind != ARG_POS and (isinstance(combined, UnionType) or len(str(combined)) > 120):
             # Avoid some noise.
             combined = AnyType()
         combined_args.append(Argument(combined, kind))
@@ -109,9 +117,31 @@ def simplify_types(types):
         return items
 
 
+# Simplified types, keyed by type. The same types tend to occur in the
+# signatures of many functions.
+_simplify_cache = {}  # type: Dict[AbstractType, AbstractType]
+
+
+def clear_caches():
+    # type: () -> None
+    """Forget all cached simplified types and type comment parses."""
+    _simplify_cache.clear()
+    parse.clear_caches()
+
+
 def simplify_recursive(typ):
     # type: (AbstractType) -> AbstractType
     """Simplify all components of a type."""
+    simplified = _simplify_cache.get(typ)
+    if simplified is None:
+        if len(_simplify_cache) >= parse.MAX_CACHE_SIZE:
+            _simplify_cache.clear()
+        simplified = _simplify_cache[typ] = _simplify_recursive(typ)
+    return simplified
+
+
+def _simplify_recursive(typ):
+    # type: (AbstractType) -> AbstractType
     if isinstance(typ, UnionType):
         return combine_types(typ.items)
     elif isinstance(typ, ClassType):
@@ -131,17 +161,22 @@ def simplify_recursive(typ):
 def flatten_types(types):
     # type: (Iterable[AbstractType]) -> List[AbstractType]
     flattened = []
-    for item in types:
+    # Use an explicit stack (with the next item at the end) instead of
+    # recursion, so that deeply nested unions don't hit the recursion limit.
+    stack = list(types)
+    stack.reverse()
+    while stack:
+        item = stack.pop()
         if not isinstance(item, UnionType):
             flattened.append(item)
         else:
-            flattened.extend(flatten_types(item.items))
+            stack.extend(reversed(item.items))
     return flattened
 
 
 def dedupe_types(types):
     # type: (Iterable[AbstractType]) -> List[AbstractType]
-    return sorted(set(types), key=lambda t: str(t))
+    return sorted(set(types), key=str)
 
 def filter_ignored_items(items):
      # type: (List[AbstractType]) -> List[AbstractType]
@@ -150,16 +185,39 @@ def filter_ignored_items(items):
               item.name not in IGNORED_ITEMS]
     return result or [AnyType()]
 
+
+# If a union has an item with the key as its name and another with the value
+# as its name, the first one is redundant.
+_SUBSUMED_BY = {
+    'str': 'Text',
+    'bool': 'int',
+    'int': 'float',
+}
+
+# A union item of one of these types is redundant if there is a more precise
+# one of the same type.
+_GENERIC_CONTAINERS = ('List', 'Dict', 'Set')
+
+
 def remove_redundant_items(items):
     # type: (List[AbstractType]) -> List[AbstractType]
     """Filter out redundant union items."""
+    # Only class types with certain names can make another item redundant, so
+    # instead of comparing all pairs of items, look up candidates by name.
+    by_name = {}  # type: Dict[str, List[ClassType]]
+    for item in items:
+        if isinstance(item, ClassType):
+            by_name.setdefault(item.name, []).append(item)
     result = []
     for item in items:
-        for other in items:
-            if item is not other and is_redundant_union_item(item, other):
-                break
-        else:
-            result.append(item)
+        if isinstance(item, ClassType):
+            if _SUBSUMED_BY.get(item.name) in by_name:
+                continue
+            if item.name in _GENERIC_CONTAINERS and any(
+                    item is not other and is_redundant_union_item(item, other)
+                    for other in by_name[item.name]):
+                continue
+        result.append(item)
     return result
 
 
@@ -172,13 +230,9 @@ def is_redundant_union_item(first, other):
     If items are equal, return False.
     """
     if isinstance(first, ClassType) and isinstance(other, ClassType):
-        if first.name == 'str' and other.name == 'Text':
-            return True
-        elif first.name == 'bool' and other.name == 'int':
-            return True
-        elif first.name == 'int' and other.name == 'float':
+        if _SUBSUMED_BY.get(first.name) == other.name:
             return True
-        elif (first.name in ('List', 'Dict', 'Set') and
+        elif (first.name in _GENERIC_CONTAINERS and
                   other.name == first.name):
             if not first.args and other.args:
                 return True
@@ -194,6 +248,9 @@ def is_redundant_union_item(first, other):
 def merge_items(items):
     # type: (List[AbstractType]) -> List[AbstractType]
     """Merge union items that can be merged."""
+    if not any(isinstance(item, _MERGEABLE_TYPES) for item in items):
+        # Usually there is nothing to merge, so avoid comparing all pairs.
+        return list(items)
     result = []
     while items:
         item = items.pop()
@@ -210,6 +267,11 @@ def merge_items(items):
     return list(reversed(result))
 
 
+# Two union items can only be merged if one of them is an instance of one of
+# these (see merged_type()).
+_MERGEABLE_TYPES = (TupleType, NoReturnType, AnyType)
+
+
 def merged_type(t, s):
     # type: (AbstractType, AbstractType) -> Optional[AbstractType]
     """Return merged type if two items can be merged in to a different, more general type.
@@ -1,13 +1,17 @@
 """Main entry point to mypy annotation inference utility."""
 
+import functools
 import json
+import multiprocessing
 
-from typing import List
+from typing import IO, Any, Callable, Iterable, Iterator, List, Optional, TypeVar
 from mypy_extensions import TypedDict
 
+from pyannotate_tools.annotations import cache
 from pyannotate_tools.annotations.types import ARG_STAR, ARG_STARSTAR
 from pyannotate_tools.annotations.infer import infer_annotation
-from pyannotate_tools.annotations.parse import parse_json
+from pyannotate_tools.annotations.parse import (FunctionInfo, iter_parse_json_file,
+                                                parse_json_file)
 
 
 # Schema of a function signature in the output
@@ -20,6 +24,10 @@ FunctionData = TypedDict('FunctionData', {'path': str,
                                           'func_name': str,
                                           'signature': Signature,
                                           'samples': int})
+
+T = TypeVar('T')
+S = TypeVar('S')
+
 SIMPLE_TYPES = {'None', 'int', 'float', 'str', 'bytes', 'bool'}
 
 def unify_type_comments(type_comments):
@@ -45,29 +53,19 @@ def is_signature_simple(signature):
             signature['return_type'] in SIMPLE_TYPES)
 
 
-def generate_annotations_json_string(source_path, only_simple=False):
-    # type: (str, bool) -> List[FunctionData]
+def generate_annotations_json_string(source_path, only_simple=False, processes=1):
+    # type: (str, bool, int) -> List[FunctionData]
     """Produce annotation data JSON file from a JSON file with runtime-collected types.
 
     Data formats:
 
     * The source JSON is a list of pyannotate_tools.annotations.parse.RawEntry items.
     * The output JSON is a list of FunctionData items.
+
+    If processes is more than 1, infer the signatures in that many worker processes.
     """
-    items = parse_json(source_path)
-    results = []
-    for item in items:
-        signature = unify_type_comments(item.type_comments)
-        if is_signature_simple(signature) or not only_simple:
-            data = {
-                'path': item.path,
-                'line': item.line,
-                'func_name': item.func_name,
-                'signature': signature,
-                'samples': item.samples
-            }  # type: FunctionData
-            results.append(data)
-    return results
+    with open(source_path, 'rb') as f:
+        return generate_annotations_from_file(f, only_simple=only_simple, processes=processes)
 
 
 def generate_annotations_json(source_path, target_path, only_simple=False):
@@ -75,4 +73,100 @@ def generate_annotations_json(source_path, target_path, only_simple=False):
     """Like generate_annotations_json_string() but writes JSON to a file."""
     results = generate_annotations_json_string(source_path, only_simple=only_simple)
     with open(target_path, 'w') as f:
-        json.dump(results, f, sort_keys=True, indent=4)
+        _dump_annotations(results, f)
+
+
+def generate_annotations(source, target, only_simple=False):
+    # type: (IO[Any], IO[str], bool) -> None
+    """Like generate_annotations_json() but reads from and writes to file objects.
+
+    Each function is written as soon as its signature has been inferred.
+    """
+    _dump_annotations(_iter_annotations_from_file(source, only_simple, 1, stream=True), target)
+
+
+def generate_annotations_from_file(source, only_simple=False, processes=1):
+    # type: (IO[Any], bool, int) -> List[FunctionData]
+    """Like generate_annotations_json_string() but reads from a file object."""
+    return list(_iter_annotations_from_file(source, only_simple, processes, stream=False))
+
+
+def _iter_annotations_from_file(source, only_simple, processes, stream):
+    # type: (IO[Any], bool, int, bool) -> Iterable[FunctionData]
+    """Generate annotations from a file, or get them from the cache.
+
+    If stream is true, decode the input one item at a time. Otherwise decode it
+    all at once with parse_json_file(), which is faster (using orjson if it's
+    installed) but holds all the items in memory.
+    """
+    key = cache.get_key(source, only_simple)
+    if key is None:
+        items = iter_parse_json_file(source) if stream else parse_json_file(source)
+        return _iter_annotations(items, only_simple, processes)
+    results = cache.load(key)
+    if results is None:
+        # All results are held in memory anyway to save them.
+        items = parse_json_file(source)
+        results = list(_iter_annotations(items, only_simple, processes))
+        cache.save(key, results)
+    return results
+
+
+def _iter_annotations(items, only_simple, processes):
+    # type: (Iterable[FunctionInfo], bool, int) -> Iterator[FunctionData]
+    annotate = functools.partial(_generate_annotation, only_simple=only_simple)
+    for data in _imap_in_processes(annotate, items, processes):
+        if data is not None:
+            yield data
+
+
+def _imap_in_processes(func, items, processes):
+    # type: (Callable[[T], S], Iterable[T], int) -> Iterator[S]
+    """Apply func to each item, in that many worker processes if processes is more than 1.
+
+    The results are yielded in the order of the items.
+    """
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # imap() preserves the order of the items.
+            for result in pool.imap(func, items, chunksize=64):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for item in items:
+            yield func(item)
+
+
+def _generate_annotation(item, only_simple):
+    # type: (FunctionInfo, bool) -> Optional[FunctionData]
+    signature = unify_type_comments(item.type_comments)
+    if only_simple and not is_signature_simple(signature):
+        return None
+    data = {
+        'path': item.path,
+        'line': item.line,
+        'func_name': item.func_name,
+        'signature': signature,
+        'samples': item.samples
+    }  # type: FunctionData
+    return data
+
+
+_INDENT = ' ' * 4
+
+
+def _dump_annotations(results, f):
+    # type: (Iterable[FunctionData], IO[str]) -> None
+    # Write the same as json.dump(list(results), f, sort_keys=True, indent=4),
+    # but one item at a time (and with one write() per item instead of
+    # json.dump()'s one write() per token).
+    sep = '[\n'
+    for data in results:
+        f.write(sep)
+        f.write(_INDENT + json.dumps(data, sort_keys=True, indent=4,
+                                     separators=(',', ': ')).replace('\n', '\n' + _INDENT))
+        sep = ',\n'
+    f.write('[]' if sep == '[\n' else '\n]')
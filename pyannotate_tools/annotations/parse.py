@@ -5,18 +5,21 @@ Parse JSON data and also parse type comment strings into type objects.
 The collect_types tool is in pyannotate_runtime/collect_types.py.
 """
 
+import codecs
 import json
 import re
 import sys
 
-from typing import Any, List, Mapping, Set, Tuple
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
 try:
     from typing import Text
 except ImportError:
     # In Python 3.5.1 stdlib, typing.py does not define Text
     Text = str  # type: ignore
 from mypy_extensions import NoReturn, TypedDict
+from six.moves import intern
 
+from pyannotate_tools.annotations import fastjson
 from pyannotate_tools.annotations.types import (
     AbstractType,
     AnyType,
@@ -92,6 +95,157 @@ class ParseError(Exception):
         super(ParseError, self).__init__('Invalid type comment: %s' % comment)
         self.comment = comment
 
+    def __reduce__(self):
+        # type: () -> Tuple[type, Tuple[str]]
+        # The default would call ParseError() with the formatted message as the
+        # comment, for example when the error comes back from a worker process.
+        return (ParseError, (self.comment,))
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DELIMITERS = frozenset(' \t\n\r,]')
+
+# How much of a JSON file to read at a time when decoding it incrementally.
+JSON_CHUNK_SIZE = 1 << 16
+
+
+def iter_json_file(f, path=None):
+    # type: (IO[Any], Optional[str]) -> Iterator[Any]
+    """Decode a JSON list from a file opened in text or binary mode, one item at a time.
+
+    The file is read a chunk at a time, so neither the decoded items nor the
+    whole text of the file are held in memory at once.
+    """
+    if path is None:
+        path = getattr(f, 'name', '<stream>')
+    return _iter_json_chunks(_read_chunks(f), path)
+
+
+def _read_chunks(f):
+    # type: (IO[Any]) -> Iterator[Text]
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = f.read(JSON_CHUNK_SIZE)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        yield chunk
+    tail = decoder.decode(b'', True)
+    if tail:
+        yield tail
+
+
+def _iter_json_chunks(chunks, path):
+    # type: (Iterator[Text], str) -> Iterator[Any]
+    decoder = json.JSONDecoder()
+    buf = _JsonBuffer(chunks)
+    buf.skip_whitespace()
+    if buf.peek() != '[':
+        data = decoder.decode(buf.read_all())
+        assert isinstance(data, list), '%s: Unexpected type %r' % (path, type(data).__name__)
+    buf.i += 1
+    buf.skip_whitespace()
+    if buf.peek() == ']':
+        buf.i += 1
+    else:
+        while True:
+            yield buf.decode(decoder, path)
+            buf.skip_whitespace()
+            c = buf.peek()
+            if c == ']':
+                buf.i += 1
+                break
+            elif c != ',':
+                raise ValueError('%s: Expecting \',\' delimiter: char %d' % (path, buf.pos()))
+            buf.i += 1
+            buf.skip_whitespace()
+    buf.skip_whitespace()
+    if buf.peek():
+        raise ValueError('%s: Extra data: char %d' % (path, buf.pos()))
+
+
+class _JsonBuffer(object):
+    """The not yet decoded part of JSON text that is read in chunks."""
+
+    def __init__(self, chunks):
+        # type: (Iterator[Text]) -> None
+        self.chunks = chunks
+        self.text = u''
+        self.i = 0  # Index of the next character to decode in text
+        self.offset = 0  # Index of text[0] in the whole text
+        self.eof = False
+
+    def pos(self):
+        # type: () -> int
+        return self.offset + self.i
+
+    def read_more(self):
+        # type: () -> bool
+        """Read more text, dropping text already decoded.
+
+        Read at least as much again as is buffered, so that a large item
+        doesn't get decoded over and over again. Return False at end of input.
+        """
+        if self.eof:
+            return False
+        parts = [self.text[self.i:]]
+        wanted = len(parts[0])
+        read = 0
+        for chunk in self.chunks:
+            parts.append(chunk)
+            read += len(chunk)
+            if read and read >= wanted:
+                break
+        else:
+            self.eof = True
+        self.offset += self.i
+        self.text = u''.join(parts)
+        self.i = 0
+        return read > 0
+
+    def read_all(self):
+        # type: () -> Text
+        while self.read_more():
+            pass
+        return self.text[self.i:]
+
+    def skip_whitespace(self):
+        # type: () -> None
+        while True:
+            m = _WHITESPACE.match(self.text, self.i)
+            assert m
+            self.i = m.end()
+            if self.i < len(self.text) or not self.read_more():
+                return
+
+    def peek(self):
+        # type: () -> Text
+        return self.text[self.i:self.i + 1]
+
+    def decode(self, decoder, path):
+        # type: (json.JSONDecoder, str) -> Any
+        while True:
+            try:
+                item, end = decoder.raw_decode(self.text, self.i)
+            except ValueError as err:
+                # The position is relative to the buffered text.
+                pos = getattr(err, 'pos', None)
+                if pos is not None:
+                    pos += self.offset
+                if not self.read_more():
+                    if pos is None:
+                        # Python 2 doesn't record the position.
+                        raise
+                    raise ValueError('%s: %s: char %d' % (path, getattr(err, 'msg'), pos))
+                continue
+            # An item must be followed by a delimiter (at least the closing
+            # ']'), otherwise a number such as 1 might be the start of 12 or 1.5.
+            if self.text[end:end + 1] in _DELIMITERS or self.eof:
+                self.i = end
+                return item
+            self.read_more()
+
 
 def parse_json(path):
     # type: (str) -> List[FunctionInfo]
@@ -99,9 +253,65 @@ def parse_json(path):
 
     The input JSON is expected to to have a list of RawEntry items.
     """
-    with open(path) as f:
-        data = json.load(f)  # type: List[RawEntry]
-    result = []
+    # Open in binary mode: decoding bytes is cheaper than going through the
+    # incremental decoder of a text file.
+    with open(path, 'rb') as f:
+        return parse_json_file(f)
+
+
+def parse_json_file(f):
+    # type: (IO[Any]) -> List[FunctionInfo]
+    """Like parse_json() but read from a file object opened in text or binary mode."""
+    path = getattr(f, 'name', '<stream>')
+    # All items are returned at once anyway, so decode the whole file in one
+    # go, which is faster than iter_json_file() (much faster with orjson).
+    data = fastjson.load(f)
+    assert isinstance(data, list), '%s: Unexpected type %r' % (path, type(data).__name__)
+    return list(_iter_function_infos(data, path))
+
+
+def iter_parse_json_file(f):
+    # type: (IO[Any]) -> Iterator[FunctionInfo]
+    """Like parse_json_file() but yield one item at a time as the file is read."""
+    path = getattr(f, 'name', '<stream>')
+    return _iter_function_infos(iter_json_file(f, path), path)
+
+
+def _iter_function_infos(items, path):
+    # type: (Iterable[Any], str) -> Iterator[FunctionInfo]
+    for item in items:
+        # Check the usual, valid case with as little overhead as possible.
+        try:
+            item_path = item['path']
+            line = item['line']
+            func_name = item['func_name']
+            type_comments = item['type_comments']
+            samples = item['samples']
+        except (KeyError, TypeError):
+            valid = False
+        else:
+            valid = (isinstance(item, dict)
+                     and isinstance(item_path, Text)
+                     and isinstance(line, int)
+                     and isinstance(func_name, Text)
+                     and isinstance(type_comments, list)
+                     and all(isinstance(comment, Text) for comment in type_comments)
+                     and isinstance(samples, int))
+        if valid:
+            if PY2:
+                item_path = encode(item_path)
+                func_name = encode(func_name)
+                type_comments = [encode(comment) for comment in type_comments]
+            # Many functions are in the same file, and some names (such as
+            # __init__) are very common, so share the strings.
+            yield FunctionInfo(intern(item_path), line, intern(func_name), type_comments, samples)
+        else:
+            yield _checked_function_info(item, path)
+
+
+def _checked_function_info(item, path):
+    # type: (Any, str) -> FunctionInfo
+    """Convert a RawEntry to FunctionInfo, failing with a helpful message if it's invalid."""
 
     def assert_type(value, typ):
         # type: (object, type) -> None
@@ -114,23 +324,19 @@ def parse_json(path):
         assert isinstance(value, typ), '%s: Unexpected type %r for key %r' % (
             path, type(value).__name__, key)
 
-    assert_type(data, list)
-    for item in data:
-        assert_type(item, dict)
-        assert_dict_item(item, 'path', Text)
-        assert_dict_item(item, 'line', int)
-        assert_dict_item(item, 'func_name', Text)
-        assert_dict_item(item, 'type_comments', list)
-        for comment in item['type_comments']:
-            assert_type(comment, Text)
-        assert_type(item['samples'], int)
-        info = FunctionInfo(encode(item['path']),
-                            item['line'],
-                            encode(item['func_name']),
-                            [encode(comment) for comment in item['type_comments']],
-                            item['samples'])
-        result.append(info)
-    return result
+    assert_type(item, dict)
+    assert_dict_item(item, 'path', Text)
+    assert_dict_item(item, 'line', int)
+    assert_dict_item(item, 'func_name', Text)
+    assert_dict_item(item, 'type_comments', list)
+    for comment in item['type_comments']:
+        assert_type(comment, Text)
+    assert_type(item['samples'], int)
+    return FunctionInfo(intern(encode(item['path'])),
+                        item['line'],
+                        intern(encode(item['func_name'])),
+                        [encode(comment) for comment in item['type_comments']],
+                        item['samples'])
 
 
 class Token(object):
@@ -170,50 +376,96 @@ class End(Token):
         return 'End()'
 
 
+# A single token (or a run of spaces) at a position in a type comment. The
+# alternatives are tried in order.
+_TOKEN = re.compile(r"""
+    (?P<space>\ +)
+  | (?P<separator>[()\[\],*]|->)
+  | (?P<name>[-\w]+(?:\s*(?:\.|:)\s*[-/\w]*)*)
+""", re.VERBOSE)
+
+
 def tokenize(s):
     # type: (str) -> List[Token]
     """Translate a type comment into a list of tokens."""
-    original = s
     tokens = []  # type: List[Token]
-    while True:
-        if not s:
-            tokens.append(End())
-            return tokens
-        elif s[0] == ' ':
-            s = s[1:]
-        elif s[0] in '()[],*':
-            tokens.append(Separator(s[0]))
-            s = s[1:]
-        elif s[:2] == '->':
-            tokens.append(Separator('->'))
-            s = s[2:]
-        else:
-            m = re.match(r'[-\w]+(\s*(\.|:)\s*[-/\w]*)*', s)
-            if not m:
-                raise ParseError(original)
-            fullname = m.group(0)
-            fullname = fullname.replace(' ', '')
-            if fullname in TYPE_FIXUPS:
-                fullname = TYPE_FIXUPS[fullname]
-            # pytz creates classes with the name of the timezone being used:
-            # https://github.com/stub42/pytz/blob/f55399cddbef67c56db1b83e0939ecc1e276cf42/src/pytz/tzfile.py#L120-L123
-            # This causes pyannotates to crash as it's invalid to have a class
-            # name with a `/` in it (e.g. "pytz.tzfile.America/Los_Angeles")
-            if fullname.startswith('pytz.tzfile.'):
-                fullname = 'datetime.tzinfo'
-            if '-' in fullname or '/' in fullname:
-                # Not a valid Python name; there are many places that
-                # generate these, so we just substitute Any rather
-                # than crashing.
-                fullname = 'Any'
+    i = 0
+    while i < len(s):
+        m = _TOKEN.match(s, i)
+        if not m:
+            raise ParseError(s)
+        i = m.end()
+        kind = m.lastgroup
+        if kind == 'separator':
+            tokens.append(Separator(m.group()))
+        elif kind == 'name':
+            text = m.group()
+            fullname = _name_cache.get(text)
+            if fullname is None:
+                fullname = _name_cache[text] = normalize_name(text)
             tokens.append(DottedName(fullname))
-            s = s[len(m.group(0)):]
+    tokens.append(End())
+    return tokens
+
+
+# Non-generic class types, keyed by name. Sharing them means that each is
+# hashed and formatted only once.
+_simple_class_types = {}  # type: Dict[str, ClassType]
+
+# Normalized names, keyed by name as written in a type comment. The same few
+# names occur over and over again.
+_name_cache = {}  # type: Dict[str, str]
+
+
+def normalize_name(name):
+    # type: (str) -> str
+    """Apply TYPE_FIXUPS and other fixups to a (dotted) name from a type comment."""
+    fullname = name.replace(' ', '')
+    if fullname in TYPE_FIXUPS:
+        fullname = TYPE_FIXUPS[fullname]
+    # pytz creates classes with the name of the timezone being used:
+    # https://github.com/stub42/pytz/blob/f55399cddbef67c56db1b83e0939ecc1e276cf42/src/pytz/tzfile.py#L120-L123
+    # This causes pyannotates to crash as it's invalid to have a class
+    # name with a `/` in it (e.g. "pytz.tzfile.America/Los_Angeles")
+    if fullname.startswith('pytz.tzfile.'):
+        fullname = 'datetime.tzinfo'
+    if '-' in fullname or '/' in fullname:
+        # Not a valid Python name; there are many places that
+        # generate these, so we just substitute Any rather
+        # than crashing.
+        fullname = 'Any'
+    # Share a single string object for each name.
+    return intern(fullname)
+
+
+# Parsed type comments, keyed by comment. Runtime-collected data tends to
+# contain the same comments many times.
+_type_comment_cache = {}  # type: Dict[str, Tuple[List[Argument], AbstractType]]
+
+# Start over once a cache gets this big, so that long-running users don't grow
+# it without bound. This is also used for the caches in infer.py.
+MAX_CACHE_SIZE = 100000
+
+
+def clear_caches():
+    # type: () -> None
+    """Forget all cached type comment parses."""
+    _type_comment_cache.clear()
+    _name_cache.clear()
+    _simple_class_types.clear()
 
 
 def parse_type_comment(comment):
     # type: (str) -> Tuple[List[Argument], AbstractType]
     """Parse a type comment of form '(arg1, ..., argN) -> ret'."""
-    return Parser(comment).parse()
+    cached = _type_comment_cache.get(comment)
+    if cached is None:
+        if len(_type_comment_cache) >= MAX_CACHE_SIZE:
+            clear_caches()
+        cached = _type_comment_cache[comment] = Parser(comment).parse()
+    arg_types, ret_type = cached
+    # Return a copy of the list so that callers can't modify the cached value.
+    return list(arg_types), ret_type
 
 
 class Parser(object):
@@ -310,7 +562,10 @@ class Parser(object):
                     return UnionType([args[0], ClassType('None')])
                 return ClassType(t.text, args)
             else:
-                return ClassType(t.text)
+                typ = _simple_class_types.get(t.text)
+                if typ is None:
+                    typ = _simple_class_types[t.text] = ClassType(t.text)
+                return typ
 
     def expect(self, s):
         # type: (str) -> None
@@ -333,9 +588,11 @@ class Parser(object):
         raise ParseError(self.comment)
 
 
-def encode(s):
-    # type: (Text) -> str
-    if PY2:
+if PY2:
+    def encode(s):
+        # type: (Text) -> str
         return s.encode('ascii')
-    else:
+else:
+    def encode(s):
+        # type: (Text) -> str
         return s
@@ -0,0 +1,17 @@
+"""The lib2to3 refactoring tool used by the command line tool."""
+
+from lib2to3.main import StdoutRefactoringTool
+
+
+class ModifiedRefactoringTool(StdoutRefactoringTool):
+    """Class that gives a nicer error message for bad encodings."""
+
+    def refactor_file(self, filename, write=False, doctests_only=False):
+        try:
+            super(ModifiedRefactoringTool, self).refactor_file(
+                filename, write=write, doctests_only=doctests_only)
+        except SyntaxError as err:
+            if str(err).startswith("unknown encoding:"):
+                self.log_error("Can't parse %s: %s", filename, err)
+            else:
+                raise
@@ -0,0 +1,68 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannotate_tools.annotations import cache
+from pyannotate_tools.annotations.main import generate_annotations_from_file
+
+
+class TestCache(unittest.TestCase):
+    DATA = b"""[{"path": "pkg/thing.py", "line": 422, "func_name": "my_function",
+                 "type_comments": ["(List[int], str) -> None"], "samples": 3}]"""
+
+    def setUp(self):
+        # type: () -> None
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('PYANNOTATE_CACHE_DIR')
+        os.environ['PYANNOTATE_CACHE_DIR'] = self.cache_dir
+
+    def tearDown(self):
+        # type: () -> None
+        if self.old_cache_dir is None:
+            del os.environ['PYANNOTATE_CACHE_DIR']
+        else:
+            os.environ['PYANNOTATE_CACHE_DIR'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache(self):
+        # type: () -> None
+        expected = [{'path': 'pkg/thing.py',
+                     'line': 422,
+                     'func_name': 'my_function',
+                     'signature': {'arg_types': ['List[int]', 'str'],
+                                   'return_type': 'None'},
+                     'samples': 3}]
+        assert generate_annotations_from_file(io.BytesIO(self.DATA)) == expected
+        assert len(os.listdir(self.cache_dir)) == 1
+        assert generate_annotations_from_file(io.BytesIO(self.DATA)) == expected
+        assert len(os.listdir(self.cache_dir)) == 1
+        # Check that the result really comes from the cache.
+        path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(path, 'w') as f:
+            f.write('["cached"]')
+        assert generate_annotations_from_file(io.BytesIO(self.DATA)) == ['cached']
+        # The only_simple flag is part of the key.
+        assert generate_annotations_from_file(io.BytesIO(self.DATA), only_simple=True) == []
+        assert len(os.listdir(self.cache_dir)) == 2
+
+    def test_get_key(self):
+        # type: () -> None
+        f = io.BytesIO(self.DATA)
+        f.seek(1)
+        key = cache.get_key(f, False)
+        assert key is not None
+        assert f.tell() == 1
+        assert cache.get_key(io.BytesIO(self.DATA[1:]), False) == key
+        assert cache.get_key(io.BytesIO(self.DATA[1:]), True) != key
+        del os.environ['PYANNOTATE_CACHE_DIR']
+        assert cache.get_key(f, False) is None
+        os.environ['PYANNOTATE_CACHE_DIR'] = self.cache_dir
+
+    def test_save_replaces_entry(self):
+        # type: () -> None
+        cache.save('key', ['old'])
+        cache.save('key', ['new'])
+        assert cache.load('key') == ['new']
+        assert os.listdir(self.cache_dir) == ['key.json']
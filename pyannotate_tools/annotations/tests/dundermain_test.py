@@ -65,6 +65,37 @@ class TestDunderMain(unittest.TestCase):
                        r'\A' + re.escape(encoding_message),
                        0)
 
+    def test_dump(self):
+        # type: () -> None
+        type_info = [
+            {
+                "path": "gcd.py",
+                "line": 1,
+                "func_name": "gcd",
+                "type_comments": [
+                    "(int, int) -> int"
+                ],
+                "samples": 2
+            },
+            {
+                "path": "pkg/lcm.py",
+                "line": 3,
+                "func_name": "lcm",
+                "type_comments": [
+                    "(int, int) -> int"
+                ],
+                "samples": 1
+            }
+        ]
+        self.write_file('type_info.json', json.dumps(type_info))
+        gcd_expected = "gcd.py:1: in gcd:\n    # type: (int, int) -> int\n"
+        lcm_expected = "pkg/lcm.py:3: in lcm:\n    # type: (int, int) -> int\n"
+        self.main_test(['--dump'],
+                       re.escape(gcd_expected + lcm_expected) + r'\Z', r'\A\Z', 0)
+        self.main_test(['--dump', 'pkg'], re.escape(lcm_expected) + r'\Z', r'\A\Z', 0)
+        self.main_test(['--dump', '-j', '2'],
+                       re.escape(gcd_expected + lcm_expected) + r'\Z', r'\A\Z', 0)
+
     def prototype_test(self, write):
         # type: (bool) -> None
         type_info = [
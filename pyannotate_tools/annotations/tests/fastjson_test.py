@@ -0,0 +1,18 @@
+import unittest
+
+from pyannotate_tools.annotations import fastjson
+
+
+class TestFastJson(unittest.TestCase):
+    def test_loads(self):
+        # type: () -> None
+        orjson = fastjson.orjson
+        try:
+            # Check both with and without the optional orjson module.
+            for fastjson.orjson in orjson, None:
+                for data in u'[{"a": 1, "b": "\\u00e9"}]', b'[{"a": 1, "b": "\\u00e9"}]':
+                    assert fastjson.loads(data) == [{u'a': 1, u'b': u'\u00e9'}]
+                with self.assertRaises(ValueError):
+                    fastjson.loads('[')
+        finally:
+            fastjson.orjson = orjson
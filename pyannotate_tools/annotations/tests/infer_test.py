@@ -3,8 +3,10 @@ import unittest
 from typing import List, Tuple
 
 from pyannotate_tools.annotations.infer import (
+    clear_caches,
     flatten_types,
     infer_annotation,
+    InferError,
     merge_items,
     remove_redundant_items,
 )
@@ -34,6 +36,13 @@ class TestInfer(unittest.TestCase):
                                          ClassType('str')]), ARG_POS)],
                             ClassType('None')))
 
+    def test_ambiguous_kind_lists_all_comments(self):
+        # type: () -> None
+        comments = ['(int) -> None', '(*int) -> None', '(int) -> None']
+        with self.assertRaises(InferError) as e:
+            infer_annotation(comments)
+        assert str(e.exception) == 'Ambiguous argument kinds:\n' + '\n'.join(comments)
+
     def test_infer_union_return(self):
         # type: () -> None
         self.assert_infer(['() -> int',
@@ -111,6 +120,14 @@ class TestInfer(unittest.TestCase):
                            ([],
                             TupleType([ClassType('List'), ClassType('List', [ClassType('x')])])))
 
+    def test_clear_caches(self):
+        # type: () -> None
+        for _ in range(2):
+            clear_caches()
+            self.assert_infer(['(Dict[str, Union[int, str]]) -> None'],
+                              ([(ClassType('Dict', [ClassType('str'), AnyType()]), ARG_POS)],
+                               ClassType('None')))
+
     def assert_infer(self, comments, expected):
         # type: (List[str], Tuple[List[Tuple[AbstractType, str]], AbstractType]) -> None
         actual = infer_annotation(comments)
@@ -214,3 +231,10 @@ class TestFlattenTypes(unittest.TestCase):
         # type: () -> None
         assert flatten_types([UnionType([UnionType([CT('int'), CT('str')]), CT('X')])]) == [
             CT('int'), CT('str'), CT('X')]
+
+    def test_deeply_nested(self):
+        # type: () -> None
+        typ = CT('int')  # type: AbstractType
+        for _ in range(5000):
+            typ = UnionType([typ, CT('str')])
+        assert flatten_types([typ]) == [CT('int')] + [CT('str')] * 5000
@@ -1,17 +1,48 @@
 import contextlib
 import os
+import sys
 import tempfile
 import textwrap
 import unittest
 
+# There seems to be no way to have this work and type-check without an
+# explicit version check. :-(
+if sys.version_info[0] == 2:
+    from cStringIO import StringIO
+else:
+    from io import StringIO
+
 from typing import Iterator
 
 from pyannotate_tools.annotations.infer import InferError
-from pyannotate_tools.annotations.main import (generate_annotations_json,
+from pyannotate_tools.annotations.main import (generate_annotations,
+                                               generate_annotations_json,
                                                generate_annotations_json_string)
 
 
 class TestMain(unittest.TestCase):
+    EXPECTED_GENERATION = textwrap.dedent("""\
+        [
+            {
+                "func_name": "my_function",
+                "line": 422,
+                "path": "pkg/thing.py",
+                "samples": 3,
+                "signature": {
+                    "arg_types": [
+                        "List[int]",
+                        "str"
+                    ],
+                    "return_type": "None"
+                }
+            }
+        ]""")
+
+    EXPECTED_AMBIGUOUS = textwrap.dedent("""\
+        Ambiguous argument kinds:
+        (List[int], str) -> None
+        (List[int], *str) -> None""")
+
     def test_generation(self):
         # type: () -> None
         data = """
@@ -34,23 +65,27 @@ class TestMain(unittest.TestCase):
                 actual = target.read()
 
         actual = actual.replace(' \n', '\n')
-        expected = textwrap.dedent("""\
-            [
-                {
-                    "func_name": "my_function",
-                    "line": 422,
-                    "path": "pkg/thing.py",
-                    "samples": 3,
-                    "signature": {
-                        "arg_types": [
-                            "List[int]",
-                            "str"
-                        ],
-                        "return_type": "None"
-                    }
-                }
-            ]""")
-        assert actual == expected
+        assert actual == self.EXPECTED_GENERATION
+
+    def test_generation_file_objects(self):
+        # type: () -> None
+        data = """
+        [
+            {
+                "path": "pkg/thing.py",
+                "line": 422,
+                "func_name": "my_function",
+                "type_comments": [
+                    "(List[int], str) -> None"
+                ],
+                "samples": 3
+            }
+        ]
+        """
+        target = StringIO()
+        generate_annotations(StringIO(data), target)
+        actual = target.getvalue().replace(' \n', '\n')
+        assert actual == self.EXPECTED_GENERATION
 
     def test_ambiguous_kind(self):
         # type: () -> None
@@ -71,10 +106,7 @@ class TestMain(unittest.TestCase):
         with self.assertRaises(InferError) as e:
             with self.temporary_json_file(data) as source_path:
                 generate_annotations_json(source_path, '/dummy')
-        assert str(e.exception) == textwrap.dedent("""\
-            Ambiguous argument kinds:
-            (List[int], str) -> None
-            (List[int], *str) -> None""")
+        assert str(e.exception) == self.EXPECTED_AMBIGUOUS
 
     def test_generate_to_memory(self):
         # type: () -> None
@@ -155,17 +187,51 @@ class TestMain(unittest.TestCase):
             }
         ]
 
+    def test_generate_in_processes(self):
+        # type: () -> None
+        data = """
+        [
+            {
+                "path": "pkg/thing.py",
+                "line": 422,
+                "func_name": "complex_function",
+                "type_comments": [
+                    "(List[int], str) -> None"
+                ],
+                "samples": 3
+            },
+            {
+                "path": "pkg/thing.py",
+                "line": 9000,
+                "func_name": "simple_function",
+                "type_comments": [
+                    "(int, str) -> None"
+                ],
+                "samples": 3
+            }
+        ]
+        """
+        with self.temporary_json_file(data) as source_path:
+            for only_simple in False, True:
+                expected = generate_annotations_json_string(source_path, only_simple=only_simple)
+                output_data = generate_annotations_json_string(source_path,
+                                                               only_simple=only_simple,
+                                                               processes=2)
+                assert output_data == expected
+                assert len(output_data) == (1 if only_simple else 2)
+
     @contextlib.contextmanager
     def temporary_json_file(self, data):
         # type: (str) -> Iterator[str]
-        source = None
+        fd, path = tempfile.mkstemp()
         try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as source:
-                source.write(data)
-            yield source.name
+            try:
+                os.write(fd, data.encode('utf-8'))
+            finally:
+                os.close(fd)
+            yield path
         finally:
-            if source is not None:
-                os.remove(source.name)
+            os.remove(path)
 
     @contextlib.contextmanager
     def temporary_file(self):
@@ -1,10 +1,22 @@
+import io
+import json
 import os
+import pickle
 import tempfile
 import unittest
 
 from typing import List, Optional, Tuple
 
-from pyannotate_tools.annotations.parse import parse_json, parse_type_comment, ParseError, tokenize
+from pyannotate_tools.annotations import parse
+from pyannotate_tools.annotations.parse import (
+    clear_caches,
+    FunctionInfo,
+    iter_json_file,
+    parse_json,
+    parse_type_comment,
+    ParseError,
+    tokenize,
+)
 from pyannotate_tools.annotations.types import (
     AbstractType,
     AnyType,
@@ -24,6 +36,13 @@ class TestParseError(unittest.TestCase):
         # type: () -> None
         assert str(ParseError('(int -> str')) == 'Invalid type comment: (int -> str'
 
+    def test_pickle(self):
+        # type: () -> None
+        err = pickle.loads(pickle.dumps(ParseError('(int -> str')))
+        assert isinstance(err, ParseError)
+        assert err.comment == '(int -> str'
+        assert str(err) == 'Invalid type comment: (int -> str'
+
 
 class TestParseJson(unittest.TestCase):
     def test_parse_json(self):
@@ -42,14 +61,7 @@ class TestParseJson(unittest.TestCase):
             }
         ]
         """
-        f = None
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-                f.write(data)
-            result = parse_json(f.name)
-        finally:
-            if f is not None:
-                os.remove(f.name)
+        result = self.parse_json_data(data)
         assert len(result) == 1
         item = result[0]
         assert item.path == 'pkg/thing.py'
@@ -59,6 +71,62 @@ class TestParseJson(unittest.TestCase):
                                       '(str) -> None']
         assert item.samples == 3
 
+    def test_parse_json_multiple_items(self):
+        # type: () -> None
+        data = """[
+            {"path": "a.py", "line": 1, "func_name": "f", "type_comments": [], "samples": 1} ,
+            {"path": "b.py", "line": 2, "func_name": "g", "type_comments": [], "samples": 2}
+        ]
+        """
+        result = self.parse_json_data(data)
+        assert [(item.path, item.line) for item in result] == [('a.py', 1), ('b.py', 2)]
+        assert self.parse_json_data(' [ ] ') == []
+
+    def test_parse_json_errors(self):
+        # type: () -> None
+        with self.assertRaises(AssertionError):
+            self.parse_json_data('{}')
+        for bad in ['', '[', '[] x', '[] []']:
+            with self.assertRaises(ValueError):
+                self.parse_json_data(bad)
+
+    def test_iter_json_file_chunks(self):
+        # type: () -> None
+        data = u'[ 1 , 23,4.5e6 ,"\u00e9x", {"a": [1, 2]}, true, null ]\n'
+        expected = [1, 23, 4.5e6, u'\u00e9x', {u'a': [1, 2]}, True, None]
+        chunk_size = parse.JSON_CHUNK_SIZE
+        try:
+            # Items and multi-byte characters straddle chunk boundaries.
+            for parse.JSON_CHUNK_SIZE in 1, 2, 3, 5, 64:
+                f = io.BytesIO(data.encode('utf-8'))
+                assert list(iter_json_file(f)) == expected
+                with self.assertRaises(ValueError):
+                    list(iter_json_file(io.BytesIO(b'[{}x]')))
+        finally:
+            parse.JSON_CHUNK_SIZE = chunk_size
+
+    def test_iter_json_file_error_position(self):
+        # type: () -> None
+        data = '[' + '1, ' * 30000 + '{"a": tru}]'
+        with self.assertRaises(ValueError) as expected:
+            json.loads(data)
+        with self.assertRaises(ValueError) as e:
+            list(iter_json_file(io.BytesIO(data.encode('utf-8')), 'type_info.json'))
+        pos = len(data) - len('tru}]')
+        assert str(e.exception) == 'type_info.json: Expecting value: char %d' % pos
+        assert 'char %d' % pos in str(expected.exception)
+
+    def parse_json_data(self, data):
+        # type: (str) -> List[FunctionInfo]
+        f = None
+        try:
+            with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+                f.write(data)
+            return parse_json(f.name)
+        finally:
+            if f is not None:
+                os.remove(f.name)
+
 
 class TestTokenize(unittest.TestCase):
     def test_tokenize(self):
@@ -103,6 +171,16 @@ def tuple_arg(items):
 
 
 class TestParseTypeComment(unittest.TestCase):
+    def test_cache(self):
+        # type: () -> None
+        clear_caches()
+        args, ret = parse_type_comment('(int) -> None')
+        args.append(any_arg())
+        assert parse_type_comment('(int) -> None') == ([class_arg('int')], ClassType('None'))
+        assert len(parse._type_comment_cache) == 1
+        clear_caches()
+        assert not parse._type_comment_cache
+
     def test_empty(self):
         # type: () -> None
         self.assert_type_comment('() -> None', ([], ClassType('None')))
@@ -199,6 +277,15 @@ class TestParseTypeComment(unittest.TestCase):
             with self.assertRaises(ParseError):
                 parse_type_comment(bad)
 
+    def test_repeated_comment(self):
+        # type: () -> None
+        comment = '(int, List[str]) -> None'
+        first = parse_type_comment(comment)
+        first[0].append(any_arg())
+        second = parse_type_comment(comment)
+        assert second == ([class_arg('int'), class_arg('List', [ClassType('str')])],
+                          ClassType('None'))
+
     def assert_type_comment(self, comment, expected):
         # type: (str, Tuple[List[Argument], AbstractType]) -> None
         actual = parse_type_comment(comment)
@@ -6,10 +6,15 @@ from typing import NamedTuple, Optional, Sequence
 class AbstractType(object):
     """Abstract base class for types."""
 
+    # Lots of type objects get created, so keep them small.
+    __slots__ = ()
+
 
 class ClassType(AbstractType):
     """A class type, potentially generic (int, List[str], None, ...)"""
 
+    __slots__ = ('name', 'args', '_hash', '_str')
+
     def __init__(self, name, args=None):
         # type: (str, Optional[Sequence[AbstractType]]) -> None
         self.name = name
@@ -17,8 +22,19 @@ class ClassType(AbstractType):
             self.args = tuple(args)
         else:
             self.args = ()
+        self._hash = None  # type: Optional[int]
+        self._str = None  # type: Optional[str]
 
     def __repr__(self):
+        # type: () -> str
+        # Types are formatted over and over again (e.g. as sort keys), and
+        # formatting a generic type formats all its arguments, so only do that
+        # once.
+        if self._str is None:
+            self._str = self._format()
+        return self._str
+
+    def _format(self):
         # type: () -> str
         if self.name == 'Tuple' and len(self.args) == 1:
             return 'Tuple[%s, ...]' % self.args[0]
@@ -33,12 +49,18 @@ class ClassType(AbstractType):
 
     def __hash__(self):
         # type: () -> int
-        return hash((self.name, self.args))
+        # Types are used as dictionary keys a lot, and hashing a generic type
+        # hashes all its arguments, so only do that once.
+        if self._hash is None:
+            self._hash = hash((self.name, self.args))
+        return self._hash
 
 
 class AnyType(AbstractType):
     """The type Any"""
 
+    __slots__ = ()
+
     def __repr__(self):
         # type: () -> str
         return 'Any'
@@ -55,6 +77,8 @@ class AnyType(AbstractType):
 class NoReturnType(AbstractType):
     """The type mypy_extensions.NoReturn"""
 
+    __slots__ = ()
+
     def __repr__(self):
         # type: () -> str
         return 'mypy_extensions.NoReturn'
@@ -71,11 +95,20 @@ class NoReturnType(AbstractType):
 class TupleType(AbstractType):
     """Fixed-length tuple Tuple[x, ..., y]"""
 
+    __slots__ = ('items', '_str')
+
     def __init__(self, items):
         # type: (Sequence[AbstractType]) -> None
         self.items = tuple(items)
+        self._str = None  # type: Optional[str]
 
     def __repr__(self):
+        # type: () -> str
+        if self._str is None:
+            self._str = self._format()
+        return self._str
+
+    def _format(self):
         # type: () -> str
         if not self.items:
             return 'Tuple[()]'  # Special case
@@ -93,11 +126,20 @@ class TupleType(AbstractType):
 class UnionType(AbstractType):
     """Union[x, ..., y]"""
 
+    __slots__ = ('items', '_str')
+
     def __init__(self, items):
         # type: (Sequence[AbstractType]) -> None
         self.items = tuple(items)
+        self._str = None  # type: Optional[str]
 
     def __repr__(self):
+        # type: () -> str
+        if self._str is None:
+            self._str = self._format()
+        return self._str
+
+    def _format(self):
         # type: () -> str
         items = self.items
         if len(items) == 2:
@@ -18,7 +18,6 @@ This fixer consumes json from TYPE_COLLECTION_JSON env variable in the following
 
 from __future__ import print_function
 
-import json  # noqa
 import os
 import re
 from contextlib import contextmanager
@@ -34,6 +33,8 @@ except ImportError:
     # In Python 3.5.1 stdlib, typing.py does not define Text
     Text = str  # type: ignore
 
+from pyannotate_tools.annotations import fastjson
+
 from .fix_annotate import FixAnnotate
 
 # Taken from mypy codebase:
@@ -215,8 +216,8 @@ class FixAnnotateJson(FixAnnotate):
         cls.top_dir = crawl_up(os.path.abspath(filename))[0]
 
     def init_stub_json(self):
-        with open(self.__class__.stub_json_file) as f:
-            data = json.load(f)
+        with open(self.__class__.stub_json_file, 'rb') as f:
+            data = fastjson.load(f)
         self.__class__.init_stub_json_from_data(data, self.filename)
 
     def get_annotation_from_stub(self, node, results, funcname):
@@ -40,4 +40,5 @@ setup(name='pyannotate',
                           'mypy_extensions',
                           'typing >= 3.5.3; python_version < "3.5"'
                           ],
+      extras_require = {'fast': ['orjson; python_version >= "3.8"']},
       )